@@ -1,10 +1,12 @@
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
+from flask_caching import Cache
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
+import json
 from datetime import datetime, timedelta
 import sys
 from pathlib import Path
@@ -14,16 +16,27 @@ from config import PATHS
 from indicators import (
     calculate_sma,
     calculate_bollinger_bands,
-    calculate_peak_offpeak_spread
+    calculate_peak_mask,
+    calculate_peak_offpeak_spread,
+    calculate_price_stats
 )
+from downsampling import lttb_indices, decimate_indices
 
 ### DATA ###
-df = pd.read_csv(PATHS['downloads']['price_data'])
-df['FECHA'] = pd.to_datetime(df['FECHA']) #convert the fecha column to a datetime object
+# Read only the needed columns from the parquet file (already typed, fecha is stored as a datetime)
+df = pd.read_parquet(PATHS['downloads']['price_data'], columns=['FECHA', 'HORA', 'PRECIO'], engine='pyarrow')
+df = df.astype({'PRECIO': 'float32', 'HORA': 'int8'}) #float32 prices halve the memory of every downstream pass
 
-#create a new column with the datetime of the fecha and hora in format YYYY-MM-DD HH:MM:SS
-df['DATETIME'] = pd.to_datetime(df['FECHA'].astype(str) + ' ' + df['HORA'].astype(str) + ':00:00')
-df = df.sort_values('DATETIME') #sort the dataframe by the datetime column
+#create a new column with the datetime of the fecha and hora (day + hours, no string parsing)
+df['DATETIME'] = df['FECHA'].values.astype('datetime64[D]') + df['HORA'].to_numpy().astype('timedelta64[h]')
+df = df.sort_values('DATETIME').reset_index(drop=True) #sort the dataframe by the datetime column
+FECHA_VALUES = df['FECHA'].values #sorted datetime64 array used to binary search the date ranges
+MIN_DATE = df['FECHA'].min() #first and last date of the data
+END_DATE = df['FECHA'].max()
+
+# Hours never change, so compute them and the peak hour flag once instead of on every chart update
+df['HOUR'] = df['DATETIME'].dt.hour.astype('int8')
+df['PEAK'] = calculate_peak_mask(df['HOUR'].to_numpy())
 
 ###### Initialize the Dash app with external stylesheets ######
 ###########################
@@ -34,6 +47,9 @@ app = dash.Dash(
     ]
 )
 
+# Server-side cache shared by the callbacks (in-memory, per process)
+cache = Cache(app.server, config={'CACHE_TYPE': 'SimpleCache'})
+
 # Define custom styles
 COLORS = {
     'primary': '#4AD7D4',
@@ -46,6 +62,38 @@ COLORS = {
     'danger': '#ef4444'
 }
 
+# Price area fill: primary color at 10% opacity
+PRIMARY_RGB = tuple(int(COLORS['primary'][i:i+2], 16) for i in (1, 3, 5))
+PRIMARY_FILL = f'rgba({PRIMARY_RGB[0]}, {PRIMARY_RGB[1]}, {PRIMARY_RGB[2]}, 0.1)'
+
+# Ranges with at least this many points are drawn with WebGL traces instead of SVG
+WEBGL_MIN_POINTS = 2000
+# Maximum number of points per trace sent to the browser
+MAX_CHART_POINTS = 2000
+
+# Price chart rows: prices on top, peak/off-peak spread below
+CHART_ROWS = dict(rows=2, cols=1, row_heights=[0.7, 0.3], shared_xaxes=True, vertical_spacing=0.05)
+_two_rows = make_subplots(**CHART_ROWS).layout #axis domains of the two row chart
+
+# Layout changes to show ('spread') or hide ('price') the peak/spread row, applied by build_chart
+# and by the clientside callback that toggles the indicators
+CHART_LAYOUTS = {
+    'spread': {
+        'height': 800,
+        'xaxis': {'showticklabels': False},
+        'yaxis': {'domain': list(_two_rows.yaxis.domain)},
+        'xaxis2': {'visible': True},
+        'yaxis2': {'visible': True, 'domain': list(_two_rows.yaxis2.domain)}
+    },
+    'price': {
+        'height': 600,
+        'xaxis': {'showticklabels': True},
+        'yaxis': {'domain': [0, 1]},
+        'xaxis2': {'visible': False},
+        'yaxis2': {'visible': False, 'domain': list(_two_rows.yaxis2.domain)}
+    }
+}
+
 ### LAYOUT ###
 app.layout = html.Div([
 
@@ -111,10 +159,10 @@ app.layout = html.Div([
                               }),
                     dcc.DatePickerRange(
                         id='date-picker',
-                        min_date_allowed=df['FECHA'].min(),
-                        max_date_allowed=df['FECHA'].max(),
-                        start_date=df['FECHA'].max() - timedelta(days=30),
-                        end_date=df['FECHA'].max(),
+                        min_date_allowed=MIN_DATE,
+                        max_date_allowed=END_DATE,
+                        start_date=END_DATE - timedelta(days=30),
+                        end_date=END_DATE,
                         display_format='YYYY-MM-DD',
                         style={
                             'zIndex': 10,
@@ -136,7 +184,7 @@ app.layout = html.Div([
                         minimum_nights=0,
                         stay_open_on_select=False,
                         show_outside_days=True,
-                        initial_visible_month=df['FECHA'].max(),
+                        initial_visible_month=END_DATE,
                         className='date-picker-custom',
                     )
                 ], style={
@@ -246,27 +294,74 @@ app.layout = html.Div([
 ])
 
 ### METHODS --> CALLBACKS ###
-# Add callback for price stats
-@app.callback(
-    Output('price-stats', 'children'), #output = price stats displayed on the cards 
-    [Input('date-picker', 'start_date'), #input = start and end date of the selected timeframe
-     Input('date-picker', 'end_date')] 
-)
-def update_stats(start_date, end_date):
-    # Handle case when dates are cleared
-    if start_date is None or end_date is None:
-        #display the entire date range of data  available
-        start_date = df['FECHA'].min()
-        end_date = df['FECHA'].max()
-    
-    mask = (df['FECHA'] >= start_date) & (df['FECHA'] <= end_date)
-    filtered_df = df[mask]
-    
+def get_slice(start_date, end_date) -> pd.DataFrame:
+    """
+    Return the rows of df between start_date and end_date (both inclusive).
+    Not memoized: the binary search and the iloc view are cheaper than
+    unpickling a cached copy of the slice.
+
+    Args:
+        start_date: Start date of the selected range
+        end_date: End date of the selected range
+
+    Returns:
+        pd.DataFrame: Filtered price data
+    """
+    start = pd.Timestamp(start_date).to_datetime64()
+    end = pd.Timestamp(end_date).to_datetime64()
+    # df is sorted by date, so the range bounds can be found with a binary search instead of a boolean mask
+    lo = np.searchsorted(FECHA_VALUES, start, side='left') #first row on or after the start date
+    hi = np.searchsorted(FECHA_VALUES, end, side='right') #first row after the end date
+    return df.iloc[lo:hi]
+
+# Indicators of a date range, memoized on the range (and window) so going back to a range does no NumPy work
+@cache.memoize(timeout=600)
+def get_bollinger_bands(start_date, end_date) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bollinger bands of the price between start_date and end_date
+
+    Returns:
+        tuple: (upper_band, middle_band, lower_band) arrays
+    """
+    bands = calculate_bollinger_bands(get_slice(start_date, end_date)['PRECIO'])
+    return tuple(band.to_numpy() for band in bands)
+
+@cache.memoize(timeout=600)
+def get_sma(start_date, end_date, window: int) -> np.ndarray:
+    """
+    Simple moving average of the price between start_date and end_date
+
+    Returns:
+        np.ndarray: Simple Moving Average
+    """
+    return calculate_sma(get_slice(start_date, end_date)['PRECIO'], window).to_numpy()
+
+@cache.memoize(timeout=600)
+def get_peak_offpeak_spread(start_date, end_date) -> np.ndarray:
+    """
+    Peak/off-peak spread of the price between start_date and end_date
+
+    Returns:
+        np.ndarray: Spread between peak and off-peak prices
+    """
+    return calculate_peak_offpeak_spread(get_slice(start_date, end_date)).to_numpy()
+
+def build_stats(filtered_df: pd.DataFrame) -> list:
+    """
+    Build the stat cards (minimum, maximum, mean and deviation of the price)
+
+    Args:
+        filtered_df (pd.DataFrame): Price data of the selected range
+
+    Returns:
+        list: Stat card components
+    """
+    minimo, maximo, promedio, desviacion = calculate_price_stats(filtered_df['PRECIO']) #one pass over the prices
     stats = [
-        {'name': 'Mínimo', 'value': filtered_df['PRECIO'].min()},
-        {'name': 'Máximo', 'value': filtered_df['PRECIO'].max()},
-        {'name': 'Promedio', 'value': filtered_df['PRECIO'].mean()},
-        {'name': 'Desviación', 'value': filtered_df['PRECIO'].std()}
+        {'name': 'Mínimo', 'value': minimo},
+        {'name': 'Máximo', 'value': maximo},
+        {'name': 'Promedio', 'value': promedio},
+        {'name': 'Desviación', 'value': desviacion}
     ]
     
     return [
@@ -297,98 +392,105 @@ def update_stats(start_date, end_date):
         }) for stat in stats
     ]
 
-# Add callback for price chart
-@app.callback(
-    Output('price-chart', 'figure'), #output the figure to be displayed
-    [Input('date-picker', 'start_date'), #input = start and end date of the selected timeframe
-     Input('date-picker', 'end_date'),
-     Input('indicators-checklist', 'value')] #input = the indicators selected
-)
-def update_chart(start_date, end_date, indicators):
-    # Handle case when dates are cleared
-    if start_date is None or end_date is None:
-        start_date = df['FECHA'].min()
-        end_date = df['FECHA'].max()
+def build_chart(start_date: pd.Timestamp, end_date: pd.Timestamp, indicators: list) -> go.Figure:
+    """
+    Build the price chart with the selected technical indicators
+
+    Args:
+        start_date (pd.Timestamp): Start date of the selected range
+        end_date (pd.Timestamp): End date of the selected range
+        indicators (list): Selected values of the indicators checklist
+
+    Returns:
+        go.Figure: Price chart
+    """
+    filtered_df = get_slice(start_date, end_date)
     
-    mask = (df['FECHA'] >= start_date) & (df['FECHA'] <= end_date)
-    filtered_df = df[mask].copy()
+    # Create the figure with two rows, the second one for the peak/spread. Every indicator trace is built
+    # and tagged with its checklist value in meta, so toggling the checklist only flips trace visibility
+    # in the browser (see the clientside callback below) without a round trip to the server
+    fig = make_subplots(**CHART_ROWS)
     
-    # Create the figure with two rows if peak/spread is selected
-    if 'peak_spread' in indicators:
-        fig = make_subplots(rows=2, cols=1, 
-                           row_heights=[0.7, 0.3],
-                           shared_xaxes=True, 
-                           vertical_spacing=0.05)
-    else:
-        fig = make_subplots(rows=1, cols=1)
+    # Use WebGL (GPU rendered) traces for long ranges, SVG for short ones since it supports spline lines
+    use_webgl = len(filtered_df) >= WEBGL_MIN_POINTS
+    scatter_trace = go.Scattergl if use_webgl else go.Scatter
+    
+    # Long ranges are downsampled to at most MAX_CHART_POINTS per trace before being sent to the browser:
+    # LTTB for the price (keeps peaks and troughs), evenly spaced points for the smooth indicators
+    # (NumPy views of the slice are passed to the traces, nothing is copied through pandas)
+    dates = filtered_df['DATETIME'].to_numpy()
+    prices = filtered_df['PRECIO'].to_numpy()
+    price_idx = lttb_indices(prices, MAX_CHART_POINTS)
+    smooth_idx = decimate_indices(len(filtered_df), MAX_CHART_POINTS)
     
     # Add price line with gradient fill
     fig.add_trace(
-        go.Scatter(
-            x=filtered_df['DATETIME'], 
-            y=filtered_df['PRECIO'],
+        scatter_trace(
+            x=dates[price_idx], 
+            y=prices[price_idx],
             name='Precio', 
-            line=dict(color=COLORS['primary'], width=2, shape='spline'),
+            line=dict(color=COLORS['primary'], width=2, shape='linear' if use_webgl else 'spline'), #spline is not supported by WebGL
             fill='tonexty',
-            fillcolor=f'rgba({int(COLORS["primary"][1:3], 16)}, {int(COLORS["primary"][3:5], 16)}, {int(COLORS["primary"][5:7], 16)}, 0.1)',
+            fillcolor=PRIMARY_FILL,
             hovertemplate='<b>Precio:</b> %{y:.2f} €/MWh<extra></extra>'
         ),
         row=1, col=1
     )
     
-    # Add selected indicators
-    if indicators:
-        if 'bb' in indicators:
-            upper, middle, lower = calculate_bollinger_bands(filtered_df['PRECIO'])
-            fig.add_trace(
-                go.Scatter(x=filtered_df['DATETIME'], y=upper,
-                          name='BB Superior', line=dict(color='red', dash='dash')),
-                row=1, col=1
-            )
-            fig.add_trace(
-                go.Scatter(x=filtered_df['DATETIME'], y=middle,
-                          name='BB Media', line=dict(color='red')),
-                row=1, col=1
-            )
-            fig.add_trace(
-                go.Scatter(x=filtered_df['DATETIME'], y=lower,
-                          name='BB Inferior', line=dict(color='red', dash='dash')),
-                row=1, col=1
-            )
-        
-        if 'sma_weekly' in indicators:
-            sma_short = calculate_sma(filtered_df['PRECIO'], 24*7)  # 7-day SMA
-            fig.add_trace(
-                go.Scatter(x=filtered_df['DATETIME'], y=sma_short,
-                          name='Media 7 días', line=dict(color='#FFA500')),
-                row=1, col=1
-            )
-        
-        if 'sma_monthly' in indicators:
-            sma_long = calculate_sma(filtered_df['PRECIO'], 24*30)  # 30-day SMA
-            fig.add_trace(
-                go.Scatter(x=filtered_df['DATETIME'], y=sma_long,
-                          name='Media 30 días', line=dict(color='magenta')),
-                row=1, col=1
-            )
-        
-        if 'peak_spread' in indicators:
-            spread = calculate_peak_offpeak_spread(filtered_df) #configure the peak hours in the function   
-            fig.add_trace(
-                go.Scatter(x=filtered_df['DATETIME'], y=spread,
-                          name='Diferencial Pico/Valle',
-                          line=dict(color='blue'),
-                          hovertemplate='<b>Diferencial:</b> %{y:.2f} €/MWh<extra></extra>'),
-                row=2, col=1
-            )
-            fig.update_yaxes(title_text="Diferencial Pico/Valle (€/MWh)", row=2, col=1)
+    # Add all indicators, only the selected ones visible (computed on the full resolution data, downsampled afterwards)
+    upper, middle, lower = get_bollinger_bands(start_date, end_date)
+    fig.add_trace(
+        scatter_trace(x=dates[smooth_idx], y=upper[smooth_idx],
+                      name='BB Superior', line=dict(color='red', dash='dash'),
+                      meta='bb', visible='bb' in indicators),
+        row=1, col=1
+    )
+    fig.add_trace(
+        scatter_trace(x=dates[smooth_idx], y=middle[smooth_idx],
+                      name='BB Media', line=dict(color='red'),
+                      meta='bb', visible='bb' in indicators),
+        row=1, col=1
+    )
+    fig.add_trace(
+        scatter_trace(x=dates[smooth_idx], y=lower[smooth_idx],
+                      name='BB Inferior', line=dict(color='red', dash='dash'),
+                      meta='bb', visible='bb' in indicators),
+        row=1, col=1
+    )
+    
+    sma_short = get_sma(start_date, end_date, 24*7)  # 7-day SMA
+    fig.add_trace(
+        scatter_trace(x=dates[smooth_idx], y=sma_short[smooth_idx],
+                      name='Media 7 días', line=dict(color='#FFA500'),
+                      meta='sma_weekly', visible='sma_weekly' in indicators),
+        row=1, col=1
+    )
+    
+    sma_long = get_sma(start_date, end_date, 24*30)  # 30-day SMA
+    fig.add_trace(
+        scatter_trace(x=dates[smooth_idx], y=sma_long[smooth_idx],
+                      name='Media 30 días', line=dict(color='magenta'),
+                      meta='sma_monthly', visible='sma_monthly' in indicators),
+        row=1, col=1
+    )
+    
+    spread = get_peak_offpeak_spread(start_date, end_date) #configure the peak hours in the function   
+    spread_idx = lttb_indices(spread, MAX_CHART_POINTS) #as jagged as the price, keep its peaks
+    fig.add_trace(
+        scatter_trace(x=dates[spread_idx], y=spread[spread_idx],
+                      name='Diferencial Pico/Valle',
+                      line=dict(color='blue'),
+                      hovertemplate='<b>Diferencial:</b> %{y:.2f} €/MWh<extra></extra>',
+                      meta='peak_spread', visible='peak_spread' in indicators),
+        row=2, col=1
+    )
+    fig.update_yaxes(title_text="Diferencial Pico/Valle (€/MWh)", row=2, col=1)
     
     # Update layout with improved styling
     fig.update_layout(
         title=None,
         xaxis_title='Fecha',
         yaxis_title='Precio (€/MWh)',
-        height=800 if 'peak_spread' in indicators else 600,
         showlegend=True,
         legend=dict(
             yanchor="top",
@@ -429,43 +531,84 @@ def update_chart(start_date, end_date, indicators):
         side='right'  # Add price scale on right side
     )
     
+    # Show or hide the peak/spread row
+    fig.update_layout(CHART_LAYOUTS['spread' if 'peak_spread' in indicators else 'price'])
+    
     return fig
 
-# Add callback for timeframe buttons
+# Timeframe of each button (1 day, 1 week, 1 month, 3 months, 6 months, 1 year, max), ending on the last date
+TIMEFRAMES = {
+    '1d-button': timedelta(days=1),
+    '1w-button': timedelta(days=7),
+    '1m-button': timedelta(days=30),
+    '3m-button': timedelta(days=90),
+    '6m-button': timedelta(days=180),
+    '1y-button': timedelta(days=365),
+    'max-button': END_DATE - MIN_DATE
+}
+TIMEFRAME_BUTTONS = list(TIMEFRAMES)
+
+# Single callback for the buttons and date picker, so a button click is one round trip
+# (instead of updating the date picker, which then triggered the stats and chart callbacks)
 @app.callback(
-    [Output('date-picker', 'start_date'), #output the start and end date of the selected timeframe
+    [Output('price-stats', 'children'), #output = price stats displayed on the cards
+     Output('price-chart', 'figure'), #output the figure to be displayed
+     Output('date-picker', 'start_date'), #output the start and end date of the selected timeframe
      Output('date-picker', 'end_date')],
-    [Input('1d-button', 'n_clicks'), #input = clicks of the time frame buttons
-     Input('1w-button', 'n_clicks'),
-     Input('1m-button', 'n_clicks'),
-     Input('3m-button', 'n_clicks'),
-     Input('6m-button', 'n_clicks'),
-     Input('1y-button', 'n_clicks'),
-     Input('max-button', 'n_clicks')]
+    [Input(button, 'n_clicks') for button in TIMEFRAME_BUTTONS] + #input = clicks of the time frame buttons
+    [Input('date-picker', 'start_date'), #input = start and end date of the selected timeframe
+     Input('date-picker', 'end_date')],
+    State('indicators-checklist', 'value') #state = the indicators selected (toggled in the browser, see below)
 )
-def update_timeframe(*args):
-    ctx = dash.callback_context
-    if not ctx.triggered:
-        return dash.no_update, dash.no_update
+def update_dashboard(*args):
+    start_date, end_date, indicators = args[-3:]
+    button_id = dash.ctx.triggered_id
     
-    button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    end_date = df['FECHA'].max()
+    if button_id in TIMEFRAMES:
+        start_date = END_DATE - TIMEFRAMES[button_id]
+        end_date = END_DATE
+        picker_dates = [start_date, end_date]
+    else:
+        picker_dates = [dash.no_update, dash.no_update] #the date picker already shows the range
     
-    timeframes = {
-        '1d-button': timedelta(days=1),
-        '1w-button': timedelta(days=7),
-        '1m-button': timedelta(days=30),
-        '3m-button': timedelta(days=90),
-        '6m-button': timedelta(days=180),
-        '1y-button': timedelta(days=365),
-        'max-button': end_date - df['FECHA'].min()
-    }
+    # Handle case when dates are cleared
+    if start_date is None or end_date is None:
+        #display the entire date range of data  available
+        start_date = MIN_DATE
+        end_date = END_DATE
     
-    if button_id in timeframes:
-        start_date = end_date - timeframes[button_id]
-        return start_date, end_date
+    # Same dates as timestamps, so they give the same cache keys whatever format the picker sent
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
     
-    return dash.no_update, dash.no_update
+    filtered_df = get_slice(start_date, end_date) #one filter pass shared by the stats and the chart
+    
+    return [build_stats(filtered_df), build_chart(start_date, end_date, indicators)] + picker_dates
+
+# Toggle the indicator traces and the peak/spread row in the browser when the checklist changes
+app.clientside_callback(
+    """
+    function(indicators, figure) {
+        if (!figure) {
+            return window.dash_clientside.no_update;
+        }
+        const layouts = %s;
+        // Indicator traces carry their checklist value in meta, the price trace has none
+        const data = figure.data.map(trace => trace.meta ? {...trace, visible: indicators.includes(trace.meta)} : trace);
+        const changes = indicators.includes('peak_spread') ? layouts.spread : layouts.price;
+        const layout = {...figure.layout};
+        for (const key in changes) {
+            const value = changes[key];
+            layout[key] = (typeof value === 'object' && !Array.isArray(value)) ? {...layout[key], ...value} : value;
+        }
+        return {...figure, data: data, layout: layout};
+    }
+    """ % json.dumps(CHART_LAYOUTS),
+    Output('price-chart', 'figure', allow_duplicate=True),
+    Input('indicators-checklist', 'value'),
+    State('price-chart', 'figure'),
+    prevent_initial_call=True
+)
 
 # Add custom CSS to the app
 app.index_string = '''
@@ -0,0 +1,60 @@
+import numpy as np
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Select the points to keep with the Largest-Triangle-Three-Buckets algorithm.
+    The data is split into n_out-2 buckets (first and last points are always kept) and
+    from each bucket the point forming the largest triangle with the previously selected
+    point and the average of the next bucket is kept, which preserves peaks and troughs.
+    The data is hourly (evenly spaced), so the row position is used as the x coordinate.
+
+    Parameters:
+    y (np.ndarray): Values to downsample
+    n_out (int): Maximum number of points to keep
+
+    Returns:
+    np.ndarray: Sorted indices of the points to keep
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3: #nothing to downsample
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=np.float64)
+    x = np.arange(n, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64) #bucket boundaries between the first and last point
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0 #previously selected point
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average point of the next bucket (the last point for the last bucket)
+        next_start = edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Triangle area (x2) formed by the previous point, each bucket candidate and the next bucket average
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + np.argmax(area)
+        indices[i + 1] = a
+
+    return indices
+
+def decimate_indices(n: int, n_out: int) -> np.ndarray:
+    """
+    Select n_out evenly spaced points (nearest neighbour decimation), enough for
+    smooth series such as moving averages.
+
+    Parameters:
+    n (int): Number of points in the series
+    n_out (int): Maximum number of points to keep
+
+    Returns:
+    np.ndarray: Sorted indices of the points to keep
+    """
+    if n <= n_out:
+        return np.arange(n)
+    return np.linspace(0, n - 1, n_out).round().astype(np.int64)
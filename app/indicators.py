@@ -1,5 +1,13 @@
 import pandas as pd
 import numpy as np
+from indicators_numba import _rolling_mean_std, _price_stats
+
+def _kernel_input(data: pd.Series) -> np.ndarray:
+    """
+    Values of data as an array the compiled kernels accept (float32 kept as is, anything else as float64)
+    """
+    values = data.to_numpy()
+    return values if values.dtype == np.float32 else values.astype(np.float64, copy=False)
 
 def calculate_sma(data: pd.Series, window: int) -> pd.Series:
     """
@@ -12,7 +20,8 @@ def calculate_sma(data: pd.Series, window: int) -> pd.Series:
     Returns:
     pd.Series: Simple Moving Average
     """
-    return data.rolling(window=window).mean()
+    mean, _ = _rolling_mean_std(_kernel_input(data), window) #compiled running-sum kernel
+    return pd.Series(mean, index=data.index)
 
 def calculate_ema(data: pd.Series, window: int) -> pd.Series:
     """
@@ -39,11 +48,34 @@ def calculate_bollinger_bands(data: pd.Series, window: int = 20, num_std: int =
     Returns:
     tuple: (upper_band, middle_band, lower_band)
     """
-    sma = calculate_sma(data, window) #calculate the simple moving average (20 days)
-    std = data.rolling(window=window).std() #calculate the rolling standard deviation (20 days)
-    upper_band = sma + (std * num_std) #calculate the upper band
-    lower_band = sma - (std * num_std) #calculate the lower band
-    return upper_band, sma, lower_band
+    mean, std = _rolling_mean_std(_kernel_input(data), window) #rolling mean and std in one pass
+    return (pd.Series(mean + num_std * std, index=data.index), #upper band
+            pd.Series(mean, index=data.index), #middle band
+            pd.Series(mean - num_std * std, index=data.index)) #lower band
+
+def calculate_price_stats(data: pd.Series) -> tuple[float, float, float, float]:
+    """
+    Calculate the minimum, maximum, mean and standard deviation in a single pass
+    
+    Parameters:
+    data (pd.Series): Price data
+    
+    Returns:
+    tuple: (minimum, maximum, mean, std)
+    """
+    return _price_stats(_kernel_input(data))
+
+def calculate_peak_mask(hours: np.ndarray) -> np.ndarray:
+    """
+    Flag the peak hours, defined as 6:00-9:59 and 19:00-22:59 for all days.
+    
+    Parameters:
+    hours (np.ndarray): Hour of the day (0-23) of each row
+    
+    Returns:
+    np.ndarray: Boolean array, True for peak hours
+    """
+    return ((hours >= 6) & (hours < 10)) | ((hours >= 19) & (hours < 23)) #morning or evening peak
 
 def calculate_peak_offpeak_spread(df: pd.DataFrame) -> pd.Series:
     """
@@ -51,25 +83,24 @@ def calculate_peak_offpeak_spread(df: pd.DataFrame) -> pd.Series:
     Peak hours are defined as 6:00-9:59 and 19:00-22:59 for all days.
     
     Parameters:
-    df (pd.DataFrame): DataFrame with datetime index and 'PRECIO' column
+    df (pd.DataFrame): DataFrame with 'PRECIO' and 'PEAK' columns (precomputed with
+    calculate_peak_mask). If 'PEAK' is missing it is derived from 'DATETIME'.
     
     Returns:
     pd.Series: Spread between peak and off-peak prices
     """
 
-    # Define morning and evening peak masks
-    morning_peak = (df['DATETIME'].dt.hour >= 6) & (df['DATETIME'].dt.hour < 10)
-    evening_peak = (df['DATETIME'].dt.hour >= 19) & (df['DATETIME'].dt.hour < 23)
-    peak_mask = morning_peak | evening_peak #combine the masks
-    offpeak_mask = ~peak_mask #opposite of peak_mask
-    
-    # Calculate average prices for each period
-    peak_prices = df.loc[peak_mask, 'PRECIO'] #mask rows where HORA is in peak_hours
-    offpeak_prices = df.loc[offpeak_mask, 'PRECIO'] #mask rows where HORA is not in peak_hours
-    
-    # Calculate the spread (peaks - offpeak)
-    spread = pd.Series(index=df.index, dtype='float64')
-    spread[peak_mask] = peak_prices - offpeak_prices.mean() #calculate the spread for the peak hours
-    spread[offpeak_mask] = peak_prices.mean() - offpeak_prices #calculate the spread for the offpeak hours
-    
-    return spread
\ No newline at end of file
+    prices = df['PRECIO'].to_numpy(dtype=np.float64)
+    if 'PEAK' in df.columns:
+        peak_mask = df['PEAK'].to_numpy() #precomputed at load time
+    else:
+        peak_mask = calculate_peak_mask(df['DATETIME'].dt.hour.to_numpy())
+
+    # Average prices for each period
+    peak_mean = prices[peak_mask].mean()
+    offpeak_mean = prices[~peak_mask].mean()
+
+    # Spread: peak hours against the offpeak average, offpeak hours against the peak average
+    spread = np.where(peak_mask, prices - offpeak_mean, peak_mean - prices)
+
+    return pd.Series(spread, index=df.index)
\ No newline at end of file
@@ -0,0 +1,97 @@
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError: #numba is optional, without it the kernels run as plain python loops
+    prange = range
+
+    def njit(*args, **kwargs):
+        """
+        No-op replacement for numba.njit when numba is not installed
+        """
+        if len(args) == 1 and callable(args[0]): #used as @njit
+            return args[0]
+        return lambda func: func #used as @njit(...)
+
+# Explicit signatures (float32 for the dashboard prices, float64 otherwise) compile the kernels when the
+# module is imported instead of on the first chart update, cache=True reuses the compiled code across restarts.
+# Read-only array signatures: pandas (copy-on-write) hands out read-only views, writable arrays also match them
+@njit(['UniTuple(float32[::1], 2)(Array(float32, 1, "A", readonly=True), int64)',
+       'UniTuple(float64[::1], 2)(Array(float64, 1, "A", readonly=True), int64)'], parallel=True, cache=True)
+def _rolling_mean_std(x: np.ndarray, w: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling mean and sample standard deviation (ddof=1, same as pandas) over a window
+    of w values, shared by the SMA and Bollinger bands. A sequential pass builds the
+    prefix sums of the values and their squares, then every window is the difference
+    of two prefix sums, so the cost does not grow with the window size and the windows
+    are computed in parallel (threads set with the NUMBA_NUM_THREADS environment variable).
+
+    Parameters:
+    x (np.ndarray): Price data
+    w (int): Window size
+
+    Returns:
+    tuple: (mean, std) arrays (NaN for the first w-1 values)
+    """
+    n = len(x)
+    mean = np.empty(n, dtype=x.dtype)
+    std = np.empty(n, dtype=x.dtype)
+
+    # Centre the values on the series mean so the prefix sums stay small and their differences keep precision
+    shift = 0.0
+    for i in range(n):
+        shift += np.float64(x[i])
+    shift = shift / n if n > 0 else 0.0
+
+    # Prefix sums (sequential, in float64 also for float32 input), csum[i] is the sum of the first i centred values
+    csum = np.zeros(n + 1)
+    csum2 = np.zeros(n + 1)
+    for i in range(n):
+        v = np.float64(x[i]) - shift
+        csum[i + 1] = csum[i] + v
+        csum2[i + 1] = csum2[i] + v * v
+
+    # Each window is independent of the others
+    for i in prange(n):
+        if i >= w - 1:
+            s = csum[i + 1] - csum[i + 1 - w]
+            s2 = csum2[i + 1] - csum2[i + 1 - w]
+            m = s / w
+            mean[i] = m + shift
+            std[i] = np.sqrt(max(0.0, (s2 - s * m) / (w - 1))) #sample variance, clip rounding noise below zero
+        else:
+            mean[i] = np.nan
+            std[i] = np.nan
+    return mean, std
+
+@njit(['UniTuple(float64, 4)(Array(float32, 1, "A", readonly=True))',
+       'UniTuple(float64, 4)(Array(float64, 1, "A", readonly=True))'], cache=True)
+def _price_stats(x: np.ndarray) -> tuple[float, float, float, float]:
+    """
+    Minimum, maximum, mean and sample standard deviation (ddof=1, same as pandas)
+    in a single pass, using Welford's algorithm for the variance
+
+    Parameters:
+    x (np.ndarray): Price data
+
+    Returns:
+    tuple: (min, max, mean, std), NaN where undefined (empty data or a single value for std)
+    """
+    n = len(x)
+    if n == 0:
+        return np.nan, np.nan, np.nan, np.nan
+    mn = x[0]
+    mx = x[0]
+    mean = 0.0
+    m2 = 0.0 #sum of squared differences from the mean
+    for i in range(n):
+        v = x[i]
+        if v < mn:
+            mn = v
+        if v > mx:
+            mx = v
+        delta = v - mean
+        mean += delta / (i + 1)
+        m2 += delta * (v - mean)
+    std = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+    return float(mn), float(mx), mean, float(std)
@@ -12,7 +12,8 @@ PATHS = {
     # precios diarios
     'downloads': {
         'dir': PROJECT_DIR / 'downloads',
-        'price_data': PROJECT_DIR / 'downloads' / 'precios_diarios_2020-01-01_2025-02-04.csv'
+        'price_data_csv': PROJECT_DIR / 'downloads' / 'precios_diarios_2020-01-01_2025-02-04.csv',
+        'price_data': PROJECT_DIR / 'downloads' / 'precios_diarios_2020-01-01_2025-02-04.parquet'
     },
     
     # grafica precios diarios
@@ -0,0 +1,27 @@
+import pandas as pd
+import sys
+from pathlib import Path
+# Add parent directory to path to import config
+sys.path.append(str(Path(__file__).parent.parent))
+from config import PATHS
+
+def convert_to_parquet(csv_path: Path, parquet_path: Path) -> pd.DataFrame:
+    """
+    Convert the downloaded price CSV to Parquet so it can be loaded with typed columns
+    and without parsing text.
+
+    Args:
+        csv_path (Path): Path to CSV file with columns ['FECHA', 'HORA', 'PRECIO']
+        parquet_path (Path): Path of the Parquet file to write
+
+    Returns:
+        pd.DataFrame: The converted price data
+    """
+    df = pd.read_csv(csv_path, dtype={'HORA': 'int8', 'PRECIO': 'float64'}, parse_dates=['FECHA'])
+    df.to_parquet(parquet_path, engine='pyarrow', compression='snappy', index=False)
+    print(f"Prices converted to {parquet_path}")
+    return df
+
+if __name__ == '__main__':
+    # One-off migration of the existing CSV download to the Parquet file used by the rest of the project
+    convert_to_parquet(PATHS['downloads']['price_data_csv'], PATHS['downloads']['price_data'])
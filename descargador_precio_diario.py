@@ -1,17 +1,21 @@
-import requests
-import json
+import asyncio
+import aiohttp
+import orjson
 from datetime import datetime, timedelta
 import pytz
 import pandas as pd
 from typing import List
 import pretty_errors
-import time
 import sys
+import os
 from pathlib import Path
 # Add parent directory to path to import config
 sys.path.append(str(Path(__file__).parent.parent))
 from config import PATHS, ESIOS_TOKEN
 
+# Local time of the prices, the UTC timestamps of the API are converted to it
+MADRID_TZ = pytz.timezone('Europe/Madrid')
+
 class ESIOS:
     """
     The ESIOS class interacts with the ESIOS API to fetch energy market data,
@@ -20,28 +24,90 @@ class ESIOS:
     Attributes:
         token (str): API token for authenticating requests to the ESIOS API.
         ruta (str): Path to save files.
+        max_concurrent (int): Maximum number of simultaneous requests to the ESIOS API.
+        cache_dir (Path): Directory where the responses of past chunks are kept to avoid downloading them again.
     """
-    def __init__(self, token : str, ruta : str):
+    def __init__(self, token : str, ruta : str, max_concurrent : int = 8):
         self.token = token
         self.ruta = ruta
+        self.max_concurrent = max_concurrent
+        self.cache_dir = Path(ruta) / '_esios_cache'
             
-    def utc_to_local(self, utc_dt : datetime) -> datetime:
+    def chunk_to_frame(self, values : List[dict]) -> pd.DataFrame:
         """
-        Converts a UTC datetime to local Madrid time.
+        Build the typed frame of one chunk, keeping only the data for Spain (geo_id is 3 for Spain).
 
         Args:
-        utc_dt (datetime): The datetime in UTC to be converted.
+            values (List[dict]): The values of the indicator returned by the ESIOS API.
 
         Returns:
-        datetime: The datetime converted to local Madrid time.
+            pd.DataFrame: Frame with the UTC timestamp ('utc') and price ('PRECIO', float64) columns.
         """
-        local_tz = pytz.timezone('Europe/Madrid')
-        local_dt = utc_dt.replace(tzinfo=pytz.utc).astimezone(local_tz)
-        return local_tz.normalize(local_dt)
-    
-    def download_precios(self, start_date : str, end_date : str, indicador : List[int]) -> pd.DataFrame:
+        chunk_df = pd.DataFrame(values, columns=['datetime_utc', 'geo_id', 'value'])
+        chunk_df = chunk_df.loc[chunk_df['geo_id'] == 3, ['datetime_utc', 'value']] #vectorized filter
+        chunk_df.columns = ['utc', 'PRECIO']
+        return chunk_df.astype({'PRECIO': 'float64'}) #a failed (empty) chunk would otherwise be an object column
+
+    async def fetch_chunk(self, session : aiohttp.ClientSession, semaphore : asyncio.Semaphore, url : str, cache_file : Path = None) -> pd.DataFrame:
         """
-        Download daily energy prices from ESIOS API.
+        Download one chunk of data from the ESIOS API, retrying with exponential backoff,
+        and build its frame as soon as it arrives.
+
+        Args:
+            session (aiohttp.ClientSession): Session shared by all the requests.
+            semaphore (asyncio.Semaphore): Limits the number of simultaneous requests.
+            url (str): API url of the indicator and chunk dates.
+            cache_file (Path): File where the response of the chunk is cached, None if the chunk can still change.
+
+        Returns:
+            pd.DataFrame: The prices of the chunk, empty if every attempt failed.
+        """
+        # Past chunks do not change, reuse the response saved by a previous run
+        if cache_file is not None and cache_file.exists():
+            try:
+                datos = orjson.loads(cache_file.read_bytes())
+                return self.chunk_to_frame(datos['indicator']['values'])
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                #corrupted or unexpected cache file, delete it and download the chunk again
+                print(f"Corrupted cache file {cache_file}, downloading the chunk again")
+                cache_file.unlink(missing_ok=True)
+
+        # Try the request up to 3 times
+        max_retries = 3
+        async with semaphore:
+            for attempt in range(max_retries):
+                try:
+                    # Make GET request to ESIOS API and parse the JSON response
+                    async with session.get(url) as response:
+                        response.raise_for_status()  # Raise an error for bad status codes
+                        raw = await response.read()
+                    datos = orjson.loads(raw) #parse the raw bytes, no intermediate str
+                    chunk_df = self.chunk_to_frame(datos['indicator']['values'])
+                    if cache_file is not None:
+                        # Only cache responses that parsed into a chunk, written to a temporary file and renamed
+                        # so an interrupted write never leaves a truncated cache file
+                        tmp_file = cache_file.with_suffix('.tmp')
+                        tmp_file.write_bytes(raw)
+                        os.replace(tmp_file, cache_file)
+                    return chunk_df
+                    
+                except (aiohttp.ClientError, asyncio.TimeoutError, orjson.JSONDecodeError, KeyError, TypeError) as e:
+                    #if the request fails, print the error and wait for 2^attempt seconds before retrying
+                    print(f"Attempt {attempt + 1} failed for {url}: {str(e)}") 
+                    
+                    if attempt < max_retries - 1: #-1 since python range is 0-indexed and we already tried once
+
+                        wait_time = 2 ** attempt  # Exponential backoff  (longer wait time for each attempt)
+                        print(f"Waiting {wait_time} seconds before retrying...")
+                        await asyncio.sleep(wait_time)
+                    else:
+                        print(f"Failed to fetch data after {max_retries} attempts")
+        return self.chunk_to_frame([])
+
+    async def download_precios(self, start_date : str, end_date : str, indicador : List[int]) -> pd.DataFrame:
+        """
+        Download daily energy prices from ESIOS API. The chunks are requested concurrently
+        (at most max_concurrent at a time) instead of one after another.
 
         Args:
             start_date (str): Start date in YYYY-MM-DD format.
@@ -51,13 +117,16 @@ class ESIOS:
         Returns:
             pd.DataFrame: A pandas DataFrame containing the daily energy prices.
         """
-        # Initialize empty list to store price records
-        registros = []
-        
         # Convert string dates to datetime objects
         start_date = datetime.strptime(start_date, "%Y-%m-%d")
         end_date = datetime.strptime(end_date, "%Y-%m-%d")
         
+        # Chunks ending before this date are final and can be cached (the last days can still be revised)
+        cache_limit = datetime.now() - timedelta(days=2)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # Build the url (and cache file) of every chunk upfront
+        urls = []
         # Process data in 30-day chunks (was getting a 504 timeout error when trying to download all data 2020-2025 at once)
         while start_date <= end_date:
 
@@ -68,79 +137,57 @@ class ESIOS:
             chunk_start_str = start_date.strftime("%Y-%m-%d")
             chunk_end_str = chunk_end.strftime("%Y-%m-%d")
             
-            print(f"\nFetching data from {chunk_start_str} to {chunk_end_str}")
-            
             # Loop through indicator IDs
             for ind in indicador:
                 # Construct API URL with indicator and chunk dates
                 url = f'https://api.esios.ree.es/indicators/{ind}?start_date={chunk_start_str}&end_date={chunk_end_str}'
-                
-                # Prepare headers with API token
-                headers = {'x-api-key': self.token}
-                
-                # Try the request up to 3 times
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        # Make GET request to ESIOS API
-                        response = requests.get(url, headers=headers)
-                        response.raise_for_status()  # Raise an error for bad status codes
-                        
-                        # Parse JSON response
-                        datos = json.loads(response.text)
-                        
-                        # Process each data point in the response
-                        for dato in datos['indicator']['values']:
-                            # Only process data for Spain (geo_id is 3 for Spain)
-                            if dato['geo_id'] == 3:
-                                # Create a new record
-                                rec = {}
-                                
-                                # Convert UTC timestamp to datetime object
-                                fecha_utc = datetime.strptime(dato['datetime_utc'], "%Y-%m-%dT%H:%M:%SZ")
-                                fecha_local = self.utc_to_local(fecha_utc)
-                                
-                                # Store date and price
-                                rec['FECHA'] = fecha_local.strftime("%Y-%m-%d")
-                                rec['HORA'] = fecha_local.strftime("%H")  # Add hour information
-                                rec['PRECIO'] = dato['value']
-                                
-                                # Add record to list
-                                registros.append(rec)
-                        
-                        # If successful, break the for loop and continue with the next chunk
-                        break 
-                        
-                    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
-                        #if the request fails, print the error and wait for 2^attempt seconds before retrying
-                        print(f"Attempt {attempt + 1} failed: {str(e)}") 
-                        
-                        if attempt < max_retries - 1: #-1 since python range is 0-indexed and we already tried once
-
-                            wait_time = 2 ** attempt  # Exponential backoff  (longer wait time for each attempt)
-                            print(f"Waiting {wait_time} seconds before retrying...")
-                            time.sleep(wait_time)
-                        else:
-                            print(f"Failed to fetch data after {max_retries} attempts")
+                cache_file = self.cache_dir / f"{ind}_{chunk_start_str}_{chunk_end_str}.json" if chunk_end < cache_limit else None
+                urls.append((url, cache_file))
             
             # Move to next chunk (start date is 1 day after the end of the current chunk)
             start_date = chunk_end + timedelta(days=1)
 
-        # Convert list of records to pandas DataFrame
-        df = pd.DataFrame(registros)
-        
-        # Sort by date and hour
-        if not df.empty:
-            df = df.sort_values(['FECHA', 'HORA'])
+        n_cached = sum(cache_file is not None and cache_file.exists() for _, cache_file in urls)
+        print(f"\nFetching {len(urls)} chunks ({n_cached} from cache)")
+
+        # Download all the chunks concurrently, reusing one session (with the API token header) for every request
+        semaphore = asyncio.Semaphore(self.max_concurrent) #respect the ESIOS rate limit
+        # Connection pool sized to the concurrency, kept alive between chunks so each request skips the TCP+TLS handshake
+        connector = aiohttp.TCPConnector(limit=self.max_concurrent, limit_per_host=self.max_concurrent, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(total=30, sock_connect=3.05) #fail fast on connect, give the API time to answer
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers={'x-api-key': self.token}) as session:
+            frames = await asyncio.gather(*(self.fetch_chunk(session, semaphore, url, cache_file) for url, cache_file in urls))
+
+        # Join the typed chunk frames in a single pandas DataFrame (gather keeps the order of the urls)
+        df = pd.concat(frames, ignore_index=True) if frames else self.chunk_to_frame([])
+
+        # Parse all the UTC timestamps at once (vectorized instead of strptime per record)
+        df['DATETIME'] = pd.to_datetime(df['utc'], format="%Y-%m-%dT%H:%M:%SZ", utc=True)
+
+        # Sort by date and hour, ESIOS returns every chunk in chronological order and the chunks are joined in order,
+        # so the sort is only needed if that changes (one O(n) check on the timestamps instead of sorting strings)
+        if not df['DATETIME'].is_monotonic_increasing:
+            df = df.sort_values('DATETIME', kind='stable', ignore_index=True)
+
+        # Convert to Madrid time and store date and hour
+        fecha_local = df['DATETIME'].dt.tz_convert(MADRID_TZ)
+        df['FECHA'] = fecha_local.dt.strftime("%Y-%m-%d")
+        df['HORA'] = fecha_local.dt.strftime("%H")
+        df = df[['FECHA', 'HORA', 'PRECIO']]
 
         return df
 
     def save_precios(self, df : pd.DataFrame, file_name : str):
         """
-        Save the prices to a CSV file.
+        Save the prices to a Parquet file (zstd compressed) or to a CSV file, depending on the extension of file_name.
         """
-        file_path = self.ruta + "/" + file_name
-        df.to_csv(file_path, index=False)
+        file_path = Path(self.ruta) / file_name
+        if file_name.endswith('.parquet'):
+            # Same typed columns as convertir_parquet.py, so it can be read without parsing text
+            df = df.astype({'FECHA': 'datetime64[ns]', 'HORA': 'int8'})
+            df.to_parquet(file_path, engine='pyarrow', compression='zstd', index=False)
+        else:
+            df.to_csv(file_path, index=False)
         print(f"Prices saved to {file_path}")
         return
 
@@ -160,8 +207,8 @@ if __name__ == '__main__':
     obj = ESIOS(token, ruta)
     
     # Download the daily energy prices
-    df_precios_diarios = obj.download_precios(start_date, end_date, indicador)
-    file_name = f"precios_diarios_{start_date}_{end_date}.csv"
+    df_precios_diarios = asyncio.run(obj.download_precios(start_date, end_date, indicador))
+    file_name = f"precios_diarios_{start_date}_{end_date}.parquet"
     
-    # Save the daily energy prices to a CSV file
+    # Save the daily energy prices to a Parquet file
     obj.save_precios(df_precios_diarios, file_name)
\ No newline at end of file
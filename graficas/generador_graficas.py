@@ -1,36 +1,92 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
+import matplotlib
+matplotlib.use('Agg') #headless rendering, skip the GUI backend detection
+from matplotlib import style
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.ticker import FuncFormatter
 import matplotlib.dates as mdates
 from datetime import datetime
 import sys
 from pathlib import Path
 import math
+import os
+import io
+from concurrent.futures import ProcessPoolExecutor
 
 # Add parent directory to path to import config
 sys.path.append(str(Path(__file__).parent.parent))
 from config import PATHS
 
-def graph_prices(prices_df: pd.DataFrame) -> None:
+# Resolution of the saved graphs, rendering cost grows with DPI² (600 dpi took seconds per figure)
+DPI = int(os.environ.get('GRAPH_DPI', 150))
+
+def figure_to_png(fig: Figure) -> bytes:
     """
-    Generate graphs for price analysis, saves it in the graphs directory
+    Render a figure to PNG bytes, so it can be returned from a worker process
     
     Args:
-        df (pd.DataFrame): DataFrame with price data
+        fig (Figure): Figure to render
+
+    Returns:
+        bytes: The PNG image
     """
-    # Calculate daily statistics
-    daily_stats = prices_df.groupby('FECHA').agg({
-        'PRECIO': ['mean', 'min', 'max']
-    }).reset_index()
-    daily_stats.columns = ['FECHA', 'PRECIO_MEDIO', 'PRECIO_MIN', 'PRECIO_MAX']
+    buffer = io.BytesIO()
+    # The figures use the constrained layout, so no bbox_inches='tight' pass re-rendering the figure to measure it
+    fig.savefig(buffer, 
+                format='png',
+                dpi=DPI,
+                )
+    return buffer.getvalue()
 
-    # Create plt figure
-    fig = plt.figure(figsize=(15, 15))
+def save_graph(png: bytes, path: Path, name: str) -> None:
+    """
+    Write a rendered graph to the graphs directory
+    
+    Args:
+        png (bytes): The PNG image
+        path (Path): Path of the graph
+        name (str): Name of the graph for the log message
+    """
+    Path(path).write_bytes(png)
+    print(f"{name} graph saved in ", path)
 
-    # Set the style to ggplot
-    plt.style.use('ggplot')
+# The figures are built with the OO API (no pyplot global state keeping them alive) and the ggplot
+# style is applied only while each render function runs
+@style.context('ggplot')
+def render_prices(prices_df: pd.DataFrame) -> bytes:
+    """
+    Render the price analysis graph
+    
+    Args:
+        prices_df (pd.DataFrame): DataFrame with price data (FECHA, HORA and PRECIO columns)
 
-    # Create a gridspec with 3 rows, and 1 column for more control over subplot placement
-    gs = fig.add_gridspec(3, 1, height_ratios=[0.01, 1, 1], hspace=0.4)
+    Returns:
+        bytes: The PNG image
+    """
+    # Calculate daily statistics, with the prices sorted by date every day is a contiguous block of rows,
+    # so the blocks are found once and reduced with numpy (no hashing of the dates as in a groupby)
+    if not prices_df['FECHA'].is_monotonic_increasing:
+        prices_df = prices_df.sort_values('FECHA', kind='stable')
+    fechas = prices_df['FECHA'].to_numpy()
+    precios = prices_df['PRECIO'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, fechas[1:] != fechas[:-1]]) #first row of each day
+    counts = np.diff(np.append(starts, len(precios))) #hours in each day
+    daily_stats = pd.DataFrame({
+        'FECHA': fechas[starts],
+        'PRECIO_MEDIO': np.add.reduceat(precios, starts) / counts,
+        'PRECIO_MIN': np.minimum.reduceat(precios, starts),
+        'PRECIO_MAX': np.maximum.reduceat(precios, starts)
+    })
+
+    # Create figure, the layout is computed once by the constrained layout engine
+    fig = Figure(figsize=(15, 15), layout='constrained')
+    FigureCanvasAgg(fig)
+    fig.get_layout_engine().set(h_pad=0.2, hspace=0.05)
+
+    # Create a gridspec with 4 rows (title, two plots and statistics), and 1 column for more control over subplot placement
+    gs = fig.add_gridspec(4, 1, height_ratios=[0.01, 1, 1, 0.08])
 
     # Add title in its own subplot
     title_ax = fig.add_subplot(gs[0])
@@ -42,18 +98,20 @@ def graph_prices(prices_df: pd.DataFrame) -> None:
     ax1 = fig.add_subplot(gs[1])
     ax2 = fig.add_subplot(gs[2])
 
-    # Plot 1: Daily Price Range
+    # Plot 1: Daily Price Range (the dense daily artists are rasterized so a vector output does not store thousands of segments)
     ax1.fill_between(daily_stats['FECHA'], 
                     daily_stats['PRECIO_MIN'], 
                     daily_stats['PRECIO_MAX'], 
                     alpha=0.7, 
                     color='skyblue', 
-                    label='Rango de Precios')
+                    label='Rango de Precios',
+                    rasterized=True)
     ax1.plot(daily_stats['FECHA'], 
             daily_stats['PRECIO_MEDIO'], 
             color='navy', 
             linewidth=1.5, 
-            label='Precio Medio Diario')
+            label='Precio Medio Diario',
+            rasterized=True)
 
     # Customize first plot
     ax1.set_title('Evolución del Precio Medio Diario', pad=20)
@@ -69,11 +127,12 @@ def graph_prices(prices_df: pd.DataFrame) -> None:
         label.set_rotation(45)
         label.set_horizontalalignment('right')
 
-    # Plot 2: Hourly Pattern
-    hourly_avg = prices_df.groupby('HORA')['PRECIO'].mean()
+    # Plot 2: Hourly Pattern (hours are 0-23, so the average of each hour is a sum and a count per bin)
+    horas = prices_df['HORA'].to_numpy(dtype=np.int64)
+    hourly_avg = np.bincount(horas, weights=precios, minlength=24) / np.bincount(horas, minlength=24)
     hours = range(24)
 
-    ax2.bar(hours, hourly_avg, color='skyblue', alpha=0.7)
+    bars = ax2.bar(hours, hourly_avg, color='skyblue', alpha=0.7)
     ax2.plot(hours, hourly_avg, color='navy', linewidth=2, marker='o')
 
     # Customize second plot
@@ -85,54 +144,54 @@ def graph_prices(prices_df: pd.DataFrame) -> None:
     ax2.set_xticklabels([f'{hour:02d}:00' for hour in hours], rotation=45)
 
     # Add price labels on the bars
-    for i, price in enumerate(hourly_avg):
-        ax2.text(i, price + 1, f'{price:.1f}€', ha='center', va='bottom', fontsize=8)
+    ax2.bar_label(bars, labels=[f'{price:.1f}€' for price in hourly_avg], padding=1, fontsize=8)
 
     # Add statistics text
     stats_text = (f'Precio Máximo: {prices_df["PRECIO"].max():.2f}€/MWh\n'
                 f'Precio Mínimo: {prices_df["PRECIO"].min():.2f}€/MWh\n'
                 f'Precio Medio: {prices_df["PRECIO"].mean():.2f}€/MWh')
-    plt.figtext(0.5, 0.02, stats_text, fontsize=10, 
+    stats_ax = fig.add_subplot(gs[3]) #in its own subplot so the layout leaves room for it
+    stats_ax.axis('off')
+    stats_ax.text(0.5, 0.5, stats_text, fontsize=10, 
+                transform=stats_ax.transAxes,
                 bbox=dict(facecolor='white', 
                         alpha=0.8, 
                         edgecolor='lightgray',
                         boxstyle='round,pad=0.5'),
                 horizontalalignment='center',
-                verticalalignment='bottom')
+                verticalalignment='center')
 
-    plt.savefig(PATHS['graphs']['price_graph'], 
-                dpi=600,  # High resolution
-                bbox_inches='tight', 
-                pad_inches=0.5,
-                format='png',  # Lossless format
-                )
-    plt.close()
-
-    print("Price graph saved in ", PATHS['graphs']['price_graph'])
+    return figure_to_png(fig)
 
-def graph_optimization_results(results_df: pd.DataFrame) -> None:
+@style.context('ggplot')
+def render_beneficio(results_df: pd.DataFrame) -> bytes:
     """
-    Generate graphs for optimization results. Saves them in the graphs directory.
+    Render the profit over time graph of the optimization results
     
     Args:
-        results_df (pd.DataFrame): DataFrame with optimization results
+        results_df (pd.DataFrame): DataFrame with optimization results (net_profit column, datetime index)
+
+    Returns:
+        bytes: The PNG image
     """
-    plt.style.use('ggplot')
-    
     # FIGURE 1: PROFIT OVER TIME
-    fig, ax = plt.subplots(figsize=(12, 6))
+    fig = Figure(figsize=(12, 6), layout='constrained')
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
     
     # Add horizontal line at y=0
     ax.axhline(y=0, color='black', linestyle='-', alpha=0.5)
     
-    # Plot positive and negative values separately with different colors
-    positive_mask = results_df['net_profit'] >= 0 #ganancia
-    negative_mask = results_df['net_profit'] < 0 #perdida
+    # Plot positive and negative values separately with different colors (rasterized, one point per day)
+    # (the other sign is set to NaN, which matplotlib leaves as a gap, instead of copying the frame per mask)
+    net_profit = results_df['net_profit'].to_numpy()
+    ganancias = np.where(net_profit >= 0, net_profit, np.nan) #ganancia
+    perdidas = np.where(net_profit < 0, net_profit, np.nan) #perdida
     
-    ax.plot(results_df[positive_mask].index, results_df[positive_mask]['net_profit'], 
-            color='green', linewidth=2, label='Ganancias')
-    ax.plot(results_df[negative_mask].index, results_df[negative_mask]['net_profit'], 
-            color='red', linewidth=2, label='Pérdidas')
+    ax.plot(results_df.index, ganancias, 
+            color='green', linewidth=2, label='Ganancias', rasterized=True)
+    ax.plot(results_df.index, perdidas, 
+            color='red', linewidth=2, label='Pérdidas', rasterized=True)
     
     ax.set_xlabel('Fecha', fontsize=10)
     ax.set_ylabel('Beneficio (€)', fontsize=10)
@@ -140,43 +199,44 @@ def graph_optimization_results(results_df: pd.DataFrame) -> None:
                 fontsize=12, pad=20, fontweight='bold')
     ax.legend(fontsize=10)
     ax.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig(PATHS['graphs']['beneficio'],
-                dpi=600,  # High resolution
-                bbox_inches='tight',
-                pad_inches=0.5,
-                format='png',  # Lossless format
-                )
-    plt.close()
+    return figure_to_png(fig)
 
-    print("Benefit graph saved in ", PATHS['graphs']['beneficio'])
+@style.context('ggplot')
+def render_monthly_profits(results_df: pd.DataFrame) -> tuple[bytes, bytes]:
+    """
+    Render the monthly profit per MWh and per MW graphs of the optimization results
+    
+    Args:
+        results_df (pd.DataFrame): DataFrame with optimization results (profit_per_mwh and profit_per_mw columns, datetime index)
 
+    Returns:
+        tuple: (profit per MWh, profit per MW) PNG images
+    """
     # Calculate number of rows and columns needed for subplots
     years = results_df.index.year.unique()
     n_years = len(years)
     n_cols = 2
     n_rows = (n_years + n_cols - 1) // n_cols
 
-    # FIGURE 2: PROFIT PER MWH Energy Capacity
-    fig, axs = plt.subplots(n_rows, n_cols, figsize=(15, 5*n_rows))
+    # Monthly profits of every year for both figures in a single groupby (indexed by year and month)
+    monthly = results_df.groupby([results_df.index.year, results_df.index.month])[['profit_per_mwh', 'profit_per_mw']].sum()
+
+    # FIGURE 2: PROFIT PER MWH Energy Capacity (same size as figure 3, so that figure is reused)
+    fig = Figure(figsize=(15, 5*n_rows), layout='constrained')
+    FigureCanvasAgg(fig)
+    axs = fig.subplots(n_rows, n_cols, squeeze=False)
     fig.suptitle('Beneficio por MWh de Energía de la Batería por mes (2020 - 2025)', 
-                y=1.02, fontsize=16, fontweight='bold')
+                fontsize=16, fontweight='bold')
     
     # Calculate global y-axis limits for MWh profits
-    all_monthly_mwh = []
-    for year in years:
-        year_data = results_df[results_df.index.year == year]
-        monthly_data = year_data.groupby(year_data.index.month)['profit_per_mwh'].sum()
-        all_monthly_mwh.extend(monthly_data.values)
-    y_min_mwh = min(all_monthly_mwh)
-    y_max_mwh = max(all_monthly_mwh)
+    y_min_mwh = monthly['profit_per_mwh'].min()
+    y_max_mwh = monthly['profit_per_mwh'].max()
     
     for idx, year in enumerate(years):
         row = idx // n_cols
         col = idx % n_cols
         
-        year_data = results_df[results_df.index.year == year]
-        monthly_data = year_data.groupby(year_data.index.month)['profit_per_mwh'].sum()
+        monthly_data = monthly.loc[year, 'profit_per_mwh'] #months of the year with data
         
         axs[row, col].bar(monthly_data.index, monthly_data.values, color='skyblue')
         axs[row, col].set_title(f'Año {year}', fontsize=10, fontweight='bold')
@@ -185,7 +245,7 @@ def graph_optimization_results(results_df: pd.DataFrame) -> None:
         axs[row, col].grid(True, alpha=0.3)
         axs[row, col].tick_params(axis='both', labelsize=8)
         axs[row, col].set_xticks(range(1, 13))
-        axs[row, col].yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format(int(x), ',')))
+        axs[row, col].yaxis.set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
         # Set consistent y-axis limits
         axs[row, col].set_ylim(y_min_mwh * 1.1, y_max_mwh * 1.1)
     
@@ -194,34 +254,24 @@ def graph_optimization_results(results_df: pd.DataFrame) -> None:
         col = idx % n_cols
         axs[row, col].set_visible(False)
     
-    plt.tight_layout() 
-    plt.savefig(PATHS['graphs']['profit_per_mwh'],
-                dpi=600,  # High resolution
-                bbox_inches='tight',
-                pad_inches=0.5,
-                format='png',  # Lossless format
-                )
-    plt.close()
-
-    print("Profit per MWh graph saved in ", PATHS['graphs']['profit_per_mwh'])
+    profit_per_mwh_png = figure_to_png(fig)
 
     # FIGURE 3: PROFIT PER MW Power Capacity
-    fig, axs = plt.subplots(n_rows, n_cols, figsize=(15, 5*n_rows))
+    fig.clear()
+    axs = fig.subplots(n_rows, n_cols, squeeze=False)
     fig.suptitle('Beneficio por MW de Potencia de la Batería por mes (2020 - 2025)', 
-                y=1.02, fontsize=16, fontweight='bold')
+                fontsize=16, fontweight='bold')
     
     # Calculate global y-axis limits for MW plot - using monthly data
-    monthly_mw = results_df.groupby([results_df.index.year, results_df.index.month])['profit_per_mw'].sum()
-    mw_min = monthly_mw.min()
-    mw_max = monthly_mw.max()
+    mw_min = monthly['profit_per_mw'].min()
+    mw_max = monthly['profit_per_mw'].max()
     mw_ylim = (mw_min, mw_max)
     
     for idx, year in enumerate(years):
         row = idx // n_cols
         col = idx % n_cols
         
-        year_data = results_df[results_df.index.year == year]
-        monthly_data = year_data.groupby(year_data.index.month)['profit_per_mw'].sum()
+        monthly_data = monthly.loc[year, 'profit_per_mw'] #months of the year with data
         
         axs[row, col].bar(monthly_data.index, monthly_data.values, color='navy')
         axs[row, col].set_title(f'Año {year}', fontsize=10, fontweight='bold')
@@ -230,7 +280,7 @@ def graph_optimization_results(results_df: pd.DataFrame) -> None:
         axs[row, col].grid(True, alpha=0.3)
         axs[row, col].tick_params(axis='both', labelsize=8)
         axs[row, col].set_xticks(range(1, 13))
-        axs[row, col].yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format(int(x), ',')))
+        axs[row, col].yaxis.set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
         axs[row, col].set_ylim(mw_ylim)
     
     for idx in range(len(years), n_rows * n_cols):
@@ -238,33 +288,55 @@ def graph_optimization_results(results_df: pd.DataFrame) -> None:
         col = idx % n_cols
         axs[row, col].set_visible(False)
     
-    plt.tight_layout() 
-    plt.savefig(PATHS['graphs']['profit_per_mw'],
-                dpi=600,  # High resolution
-                bbox_inches='tight',
-                pad_inches=0.5,
-                format='png',  # Lossless format
-                )
-    plt.close()
+    profit_per_mw_png = figure_to_png(fig)
+
+    return profit_per_mwh_png, profit_per_mw_png
 
-    print("Profit per MW graph saved in ", PATHS['graphs']['profit_per_mw'])
+def graph_prices(prices_df: pd.DataFrame) -> None:
+    """
+    Generate graphs for price analysis, saves it in the graphs directory
+    
+    Args:
+        prices_df (pd.DataFrame): DataFrame with price data
+    """
+    save_graph(render_prices(prices_df), PATHS['graphs']['price_graph'], "Price")
+
+def graph_optimization_results(results_df: pd.DataFrame) -> None:
+    """
+    Generate graphs for optimization results. Saves them in the graphs directory.
+    
+    Args:
+        results_df (pd.DataFrame): DataFrame with optimization results
+    """
+    save_graph(render_beneficio(results_df), PATHS['graphs']['beneficio'], "Benefit")
+    profit_per_mwh_png, profit_per_mw_png = render_monthly_profits(results_df)
+    save_graph(profit_per_mwh_png, PATHS['graphs']['profit_per_mwh'], "Profit per MWh")
+    save_graph(profit_per_mw_png, PATHS['graphs']['profit_per_mw'], "Profit per MW")
 
 if __name__ == "__main__":
     # Read the data for prices and optimization results
-    prices_df = pd.read_csv(PATHS['downloads']['price_data'])
+    prices_df = pd.read_parquet(PATHS['downloads']['price_data'], columns=['FECHA', 'HORA', 'PRECIO'], engine='pyarrow')
     results_df = pd.read_csv(PATHS['optimization']['results'])
 
-    # Process prices datetime cols 
-    prices_df['FECHA'] = pd.to_datetime(prices_df['FECHA'])
-    prices_df['DATETIME'] = pd.to_datetime(prices_df['FECHA'].astype(str) + ' ' + prices_df['HORA'].astype(str) + ':00:00')
+    # Process prices datetime cols, dates without time and int8 hours as compact groupby keys
+    prices_df['FECHA'] = pd.to_datetime(prices_df['FECHA'], format='%Y-%m-%d', cache=True).values.astype('datetime64[D]')
+    prices_df['HORA'] = prices_df['HORA'].astype('int8')
+    prices_df['DATETIME'] = prices_df['FECHA'] + pd.to_timedelta(prices_df['HORA'], unit='h') #date + hours, no string parsing
     prices_df = prices_df.sort_values('DATETIME')
     
     # Process results dataframe process datetime cols 
     results_df['datetime'] = pd.to_datetime(results_df['datetime'])
     results_df.set_index('datetime', inplace=True)
     
-    # Generate price graphs
-    graph_prices(prices_df)
+    # Generate the price and optimization results graphs in parallel, they are independent of each other
+    # (each worker only gets the columns it plots, to keep the pickling small)
+    with ProcessPoolExecutor(max_workers=3) as executor:
+        price_graph = executor.submit(render_prices, prices_df[['FECHA', 'HORA', 'PRECIO']])
+        beneficio = executor.submit(render_beneficio, results_df[['net_profit']])
+        monthly_profits = executor.submit(render_monthly_profits, results_df[['profit_per_mwh', 'profit_per_mw']])
 
-    # Generate optimization results graphs
-    graph_optimization_results(results_df)
+        save_graph(price_graph.result(), PATHS['graphs']['price_graph'], "Price")
+        save_graph(beneficio.result(), PATHS['graphs']['beneficio'], "Benefit")
+        profit_per_mwh_png, profit_per_mw_png = monthly_profits.result()
+        save_graph(profit_per_mwh_png, PATHS['graphs']['profit_per_mwh'], "Profit per MWh")
+        save_graph(profit_per_mw_png, PATHS['graphs']['profit_per_mw'], "Profit per MW")
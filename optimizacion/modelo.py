@@ -100,18 +100,18 @@ class BatteryOptimizer:
 
 def load_prices(file_path: str) -> pd.DataFrame:
     """
-    Load prices from CSV file
+    Load prices from Parquet file
     
     Args:
-        file_path (str): Path to CSV file with columns ['FECHA', 'HORA', 'PRECIO']
+        file_path (str): Path to Parquet file with columns ['FECHA', 'HORA', 'PRECIO']
         
     Returns:
         pd.DataFrame: DataFrame with datetime index and prices
     """
-    df = pd.read_csv(file_path)
+    df = pd.read_parquet(file_path, columns=['FECHA', 'HORA', 'PRECIO'], engine='pyarrow')
     df['FECHA'] = pd.to_datetime(df['FECHA']) #convert the fecha column to a datetime object
-    #create a new column with the datetime of the fecha and hora in format YYYY-MM-DD HH:MM:SS
-    df['DATETIME'] = pd.to_datetime(df['FECHA'].astype(str) + ' ' + df['HORA'].astype(str) + ':00:00')
+    #create a new column with the datetime of the fecha and hora (day + hours, no string parsing)
+    df['DATETIME'] = df['FECHA'] + pd.to_timedelta(df['HORA'], unit='h')
     df = df.sort_values('DATETIME') #sort the dataframe by the datetime column
 
     return df